@@ -1,57 +1,245 @@
 """
     Script to fetch equipment skill requirements from osrsreboxed-db.
 
+    Requirements are read from a single download of the osrsreboxed-db repository archive.
+    Any items the archive download did not reach are fetched individually instead.
+
     The requirements JSON file is placed in ../cdn/json/equipment-requirements.json.
 
     This script is idempotent - it will skip items that already have requirements
-    in the output file and only fetch missing ones.
+    in the output file and only fetch missing ones. Progress is appended to a
+    .partial.jsonl file while running, so an interrupted run can be resumed.
 
     Written for Python 3.9.
 """
 import os
 import json
 import requests
+import tarfile
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 EQUIPMENT_PATH = '../cdn/json/equipment.json'
 OUTPUT_PATH = '../cdn/json/equipment-requirements.json'
+PROGRESS_PATH = 'equipment-requirements.partial.jsonl'
 BASE_URL = 'https://raw.githubusercontent.com/0xNeffarion/osrsreboxed-db/refs/heads/master/docs/items-json'
+ARCHIVE_URL = 'https://github.com/0xNeffarion/osrsreboxed-db/archive/refs/heads/master.tar.gz'
+ARCHIVE_ITEMS_DIR = 'docs/items-json'
 
-# Rate limiting
+# Rate limiting. The request rate starts at INITIAL_REQUESTS_PER_SECOND, is halved whenever the server
+# responds with 429, and recovers by RATE_INCREASE after every RATE_INCREASE_AFTER consecutive successes.
 BATCH_SIZE = 50
-BATCH_DELAY_SECONDS = 1.0
 MAX_WORKERS = 10
+MAX_RETRIES = 5
+# The bounds keep raw.githubusercontent.com below 50 requests per second, starting at half that
+# until responses show the server is keeping up.
+INITIAL_REQUESTS_PER_SECOND = 25.0
+MIN_REQUESTS_PER_SECOND = 1.0
+MAX_REQUESTS_PER_SECOND = 50.0
+RATE_INCREASE = 2.5
+RATE_INCREASE_AFTER = 20
+
+
+class RateLimiter:
+    """Thread-safe AIMD (additive increase, multiplicative decrease) request rate limiter."""
+
+    def __init__(self, requests_per_second):
+        self.requests_per_second = requests_per_second
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self._successes = 0
+
+    def acquire(self):
+        """Block until the caller is allowed to send its next request."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= RATE_INCREASE_AFTER:
+                self._successes = 0
+                self.requests_per_second = min(MAX_REQUESTS_PER_SECOND, self.requests_per_second + RATE_INCREASE)
+
+    def on_throttle(self):
+        with self._lock:
+            self._successes = 0
+            self.requests_per_second = max(MIN_REQUESTS_PER_SECOND, self.requests_per_second / 2)
+
+
+RATE_LIMITER = RateLimiter(INITIAL_REQUESTS_PER_SECOND)
+
+
+class ThrottleAwareRetry(Retry):
+    """Retry policy that also reports 429 responses to the rate limiter before backing off."""
+
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        if response is not None and response.status == 429:
+            RATE_LIMITER.on_throttle()
+        return super().increment(method, url, response, *args, **kwargs)
+
+
+# Shared across worker threads so TCP/TLS connections to the CDN are kept alive between requests
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
+})
+# pool_block makes threads wait for a warm pooled connection rather than opening throwaway extra ones.
+# Transient failures (timeouts, throttling, 5xx) are retried with exponential backoff, honouring Retry-After.
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=MAX_WORKERS,
+    pool_maxsize=MAX_WORKERS,
+    pool_block=True,
+    max_retries=ThrottleAwareRetry(
+        total=MAX_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        respect_retry_after_header=True,
+    ),
+))
+
+def get_requirements(data):
+    """Extract the skill requirements from an osrsreboxed-db item, or None if it has none."""
+    # Requirements are in equipment.requirements
+    if data.get('equipment') and data['equipment'].get('requirements'):
+        reqs = data['equipment']['requirements']
+        if reqs and len(reqs) > 0:
+            return reqs
+
+    return None
+
+
+def download_bulk(item_ids):
+    """
+    Fetch requirements for the given items from a single download of the osrsreboxed-db archive.
+    The archive is streamed and only the wanted items are parsed.
+
+    Returns (requirements, unread_ids). If the download fails part-way, requirements holds everything
+    parsed so far and unread_ids lists the items that were not reached, to be fetched individually.
+    """
+    wanted = {f'{item_id}.json': item_id for item_id in item_ids}
+    read = set()
+    requirements = {}
+
+    try:
+        with SESSION.get(ARCHIVE_URL, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+
+            # Members are named like "osrsreboxed-db-master/docs/items-json/4151.json"
+            with tarfile.open(fileobj=r.raw, mode='r|gz') as archive:
+                for member in archive:
+                    directory, _, filename = member.name.rpartition('/')
+                    if not member.isfile() or not directory.endswith(ARCHIVE_ITEMS_DIR) or filename not in wanted:
+                        continue
+
+                    reqs = get_requirements(json.load(archive.extractfile(member)))
+                    if reqs:
+                        requirements[str(wanted[filename])] = reqs
+                    read.add(filename)
+
+    except Exception as e:
+        print(f'  Error downloading archive: {e}')
+        return requirements, [item_id for filename, item_id in wanted.items() if filename not in read]
+
+    return requirements, []
+
 
 def fetch_item_requirements(item_id):
     """Fetch requirements for a single item from osrsreboxed-db."""
     url = f'{BASE_URL}/{item_id}.json'
 
     try:
-        r = requests.get(url, headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        }, timeout=10)
+        RATE_LIMITER.acquire()
+        r = SESSION.get(url, timeout=10)
+
+        # Throttled and failing responses raise once retries are exhausted, so anything here was served normally
+        if r.status_code == 404 or r.ok:
+            RATE_LIMITER.on_success()
 
         if r.status_code == 404:
             # Item not found in osrsreboxed-db, skip silently
             return item_id, None
 
         r.raise_for_status()
-        data = r.json()
-
-        # Requirements are in equipment.requirements
-        if data.get('equipment') and data['equipment'].get('requirements'):
-            reqs = data['equipment']['requirements']
-            if reqs and len(reqs) > 0:
-                return item_id, reqs
-
-        return item_id, None
+        return item_id, get_requirements(r.json())
 
     except Exception as e:
         print(f'  Error fetching item {item_id}: {e}')
         return item_id, None
 
 
+def load_jsonl(path):
+    """Load a file of one {id: value} object per line into a single dict, later lines taking precedence."""
+    values = {}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                values.update(json.loads(line))
+            except ValueError:
+                # The last line may be truncated if the run was killed mid-write
+                continue
+    return values
+
+
+def open_jsonl_for_append(path):
+    """Open a file of one object per line for appending, first dropping any truncated last line."""
+    if os.path.exists(path):
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                # Left by a run killed mid-write; appending onto it would corrupt the next record too
+                f.truncate(data.rfind(b'\n') + 1)
+    return open(path, 'a')
+
+
+def save_requirements(requirements):
+    """Write the final requirements file and discard the progress file it supersedes."""
+    with open(OUTPUT_PATH, 'w') as f:
+        json.dump(requirements, f, indent=2)
+    if os.path.exists(PROGRESS_PATH):
+        os.remove(PROGRESS_PATH)
+
+
+def fetch_individually(items_to_fetch, all_requirements):
+    """Fetch requirements one item at a time, in batches with threading. Returns the number of items found."""
+    new_requirements_count = 0
+    total_batches = (len(items_to_fetch) + BATCH_SIZE - 1) // BATCH_SIZE
+
+    # A single pool for the whole run keeps worker threads (and their connections) warm between batches.
+    # New results are only appended to the progress file; the output file is written once at the end.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, open_jsonl_for_append(PROGRESS_PATH) as progress_file:
+        for batch_num, i in enumerate(range(0, len(items_to_fetch), BATCH_SIZE)):
+            batch = items_to_fetch[i:i + BATCH_SIZE]
+            batch_display = f'{batch_num + 1}/{total_batches}'
+            items_display = f'{i + 1}-{min(i + BATCH_SIZE, len(items_to_fetch))}'
+
+            print(f'Fetching batch {batch_display} (items {items_display})...', end='', flush=True)
+
+            batch_found = 0
+            for item_id, requirements in executor.map(fetch_item_requirements, batch):
+                if requirements:
+                    all_requirements[str(item_id)] = requirements
+                    progress_file.write(json.dumps({str(item_id): requirements}, separators=(',', ':')) + '\n')
+                    batch_found += 1
+                    new_requirements_count += 1
+
+            print(f' found {batch_found} with requirements ({RATE_LIMITER.requests_per_second:.0f} req/s)')
+
+            # Flush progress after each batch (for resume capability)
+            progress_file.flush()
+
+    return new_requirements_count
+
+
 def main():
     print('=== Equipment Requirements Fetcher ===\n')
 
@@ -72,6 +260,15 @@ def main():
             existing_requirements = json.load(f)
         print(f'Found {len(existing_requirements)} existing requirements\n')
 
+    # Merge in anything fetched by a previous interrupted run
+    resumed_count = 0
+    if os.path.exists(PROGRESS_PATH):
+        print('Loading progress from previous run...')
+        progress = load_jsonl(PROGRESS_PATH)
+        resumed_count = len(progress)
+        existing_requirements.update(progress)
+        print(f'Resumed {resumed_count} requirements\n')
+
     # Get all item IDs that need fetching
     all_item_ids = [item['id'] for item in equipment]
     items_to_fetch = [
@@ -83,40 +280,23 @@ def main():
 
     if len(items_to_fetch) == 0:
         print('All items already have requirements. Nothing to do.')
+        if resumed_count > 0:
+            save_requirements(existing_requirements)
         return
 
-    # Fetch in batches with threading
     all_requirements = dict(existing_requirements)
-    new_requirements_count = 0
-    total_batches = (len(items_to_fetch) + BATCH_SIZE - 1) // BATCH_SIZE
-
-    for batch_num, i in enumerate(range(0, len(items_to_fetch), BATCH_SIZE)):
-        batch = items_to_fetch[i:i + BATCH_SIZE]
-        batch_display = f'{batch_num + 1}/{total_batches}'
-        items_display = f'{i + 1}-{min(i + BATCH_SIZE, len(items_to_fetch))}'
-
-        print(f'Fetching batch {batch_display} (items {items_display})...', end='', flush=True)
-
-        batch_found = 0
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(fetch_item_requirements, item_id): item_id for item_id in batch}
-
-            for future in as_completed(futures):
-                item_id, requirements = future.result()
-                if requirements:
-                    all_requirements[str(item_id)] = requirements
-                    batch_found += 1
-                    new_requirements_count += 1
 
-        print(f' found {batch_found} with requirements')
+    print('Downloading osrsreboxed-db archive...')
+    bulk_requirements, unread_ids = download_bulk(items_to_fetch)
+    all_requirements.update(bulk_requirements)
+    new_requirements_count = len(bulk_requirements)
+    print(f'Found {new_requirements_count} with requirements')
 
-        # Save progress after each batch (for resume capability)
-        with open(OUTPUT_PATH, 'w') as f:
-            json.dump(all_requirements, f, indent=2)
+    if len(unread_ids) > 0:
+        print(f'Archive incomplete, fetching {len(unread_ids)} remaining items individually\n')
+        new_requirements_count += fetch_individually(unread_ids, all_requirements)
 
-        # Rate limit between batches
-        if i + BATCH_SIZE < len(items_to_fetch):
-            time.sleep(BATCH_DELAY_SECONDS)
+    save_requirements(all_requirements)
 
     print(f'\n=== Complete ===')
     print(f'Total items with requirements: {len(all_requirements)}')
@@ -10,7 +10,8 @@
 """
 import os
 import json
-from collections import defaultdict
+from collections import Counter
+from typing import NamedTuple
 
 EQUIPMENT_PATH = '../cdn/json/equipment.json'
 REQUIREMENTS_PATH = '../cdn/json/equipment-requirements.json'
@@ -18,6 +19,15 @@ ALIASES_PATH = '../cdn/json/equipment_aliases.json'
 OUTPUT_PATH = '../cdn/json/missing-requirements.json'
 
 
+class EquipmentRow(NamedTuple):
+    """The fields of an equipment item that are reported when it is missing requirements, in output order."""
+    id: int
+    name: str
+    wiki_name: str
+    version: str
+    slot: str
+
+
 def get_wiki_name(item):
     """
     Extract the wiki name from the image field.
@@ -45,53 +55,47 @@ def main():
     print('Loading equipment-requirements.json...')
     with open(REQUIREMENTS_PATH, 'r') as f:
         requirements = json.load(f)
-    requirements_ids = set(int(k) for k in requirements.keys())
+    # Item IDs are kept as the string keys used in the JSON files, avoiding int() on every key
+    requirements_ids = frozenset(requirements.keys())
     print(f'Found {len(requirements_ids)} items with requirements')
 
     # Load aliases (variant_id -> base_id)
     print('Loading equipment_aliases.json...')
     with open(ALIASES_PATH, 'r') as f:
-        aliases = json.load(f)
-    # Convert to int keys
-    alias_map = {int(k): int(v) for k, v in aliases.items()}
+        alias_map = json.load(f)
     print(f'Found {len(alias_map)} item aliases')
 
+    # Items that have requirements directly, or are variants of a base item that does
+    covered_ids = requirements_ids | {k for k, v in alias_map.items() if str(v) in requirements_ids}
+
     # Find items missing requirements
     print('\nAnalyzing items...')
-    missing = []
-    by_slot = defaultdict(list)
-
-    for item in equipment:
-        item_id = item['id']
-        item_name = item['name']
-        item_version = item.get('version', '')
-        item_slot = item.get('slot', 'unknown')
-        wiki_name = get_wiki_name(item)
-
-        # Check if item has requirements directly
-        if item_id in requirements_ids:
-            continue
-
-        # Check if item is a variant with a base item that has requirements
-        base_id = alias_map.get(item_id)
-        if base_id is not None and base_id in requirements_ids:
-            continue
-
-        # Item is missing requirements
-        entry = {
-            'id': item_id,
-            'name': item_name,
-            'wiki_name': wiki_name,
-            'version': item_version,
-            'slot': item_slot,
-        }
+
+    # Read the reported fields of each missing item once
+    missing_rows = [
+        EquipmentRow(
+            id=item['id'],
+            name=item['name'],
+            wiki_name=get_wiki_name(item),
+            version=item.get('version', ''),
+            slot=item.get('slot', 'unknown'),
+        )
+        for item in equipment
+        if str(item['id']) not in covered_ids
+    ]
+
+    def build_entry(row):
+        entry = row._asdict()
 
         # Include base_id if it's aliased (but base also missing requirements)
+        base_id = alias_map.get(str(row.id))
         if base_id is not None:
             entry['aliased_to'] = base_id
 
-        missing.append(entry)
-        by_slot[item_slot].append(item_name)
+        return entry
+
+    missing = [build_entry(row) for row in missing_rows]
+    by_slot_counts = Counter(entry['slot'] for entry in missing)
 
     # Sort by slot, then by name
     missing.sort(key=lambda x: (x['slot'], x['name']))
@@ -100,15 +104,15 @@ def main():
     print(f'\n=== Results ===')
     print(f'Items missing requirements: {len(missing)}')
     print(f'\nBy slot:')
-    for slot in sorted(by_slot.keys()):
-        print(f'  {slot}: {len(by_slot[slot])}')
+    for slot in sorted(by_slot_counts.keys()):
+        print(f'  {slot}: {by_slot_counts[slot]}')
 
     # Save to JSON
     output = {
         'total_equipment': len(equipment),
         'total_with_requirements': len(requirements_ids),
         'total_missing': len(missing),
-        'by_slot_counts': {slot: len(items) for slot, items in sorted(by_slot.items())},
+        'by_slot_counts': dict(sorted(by_slot_counts.items())),
         'items': missing,
     }
 